@@ -1,21 +1,147 @@
 # coding=utf-8
 """Lua lexer for CS325."""
 
-import re
-from luaparser.types import Tuple, TokenType, LexIterator, TokenIterator, \
-    ErrorStore
-
-
-class LexEx(Exception):
-    """All lexing errors extend this class"""
+from __future__ import annotations
 
-    @property
-    def msg(self):
-        """Get the message passed in the error."""
-        try:
-            return self.args[0]
-        except IndexError:
-            return ""
+import bisect
+import re
+import string
+import sys
+from luaparser.types import TokenIterator, ErrorStore, NAME, STR, NUM, KEY, \
+    SYM, INVALID
+
+# Characters which may follow a '\\' in a string, apart from digits.
+_ESCAPES = b'abfnrtv\\"\''
+
+# Token type of each keyword.
+_KEYWORD_TYPES = dict.fromkeys([b'and', b'break', b'do', b'else', b'elseif',
+                                b'end', b'false', b'for', b'function', b'if',
+                                b'in', b'local', b'nil', b'not', b'or',
+                                b'repeat', b'return', b'then', b'true',
+                                b'until', b'while'], KEY)
+
+# Reported once for every illegal escape in a string.
+_ILLEGAL_ESCAPE = "Illegal escape in string."
+
+# Symbols consisting of a single character.
+_SYMBOLS = frozenset(b"+-*/%^#(){}[];:,")
+
+
+def _trie(words: list[bytes]) -> dict:
+    """
+    Build a trie of the given words.
+    :param words: Byte strings to store in the trie.
+    :return: Nested dictionaries keyed by bytes. The None key holds the word
+    ending at that node.
+    """
+    root: dict = {}
+    for word in words:
+        node = root
+        for c in word:
+            node = node.setdefault(c, {})
+        node[None] = word
+    return root
+
+
+# Symbols which can be followed by further symbol characters.
+_LONG_SYMBOL_LIST = [b"...", b"..", b".", b"==", b"~=", b"<=", b"=", b">=",
+                     b"<", b">"]
+_LONG_SYMBOLS = _trie(_LONG_SYMBOL_LIST)
+
+# Lua names and well-formed numbers.
+_NAME_RE = re.compile(rb'[A-Za-z_][A-Za-z0-9_]*')
+_NUMBER_RE = re.compile(rb'0x[0-9a-fA-F]*|'
+                        rb'[0-9]*(?:\.[0-9]*)?(?:[eE][+-]?[0-9]*)?')
+
+# Characters which make a number malformed if they follow a number matched
+# by '_NUMBER_RE'.
+_NUMBER_ERRORS = frozenset({b'.', b'e', b'E'})
+
+# A number which may contain several decimal points or exponents. A sign is
+# only allowed directly after the first exponent.
+_MALFORMED_NUMBER_RE = re.compile(rb'[0-9.]*(?:[eE][+-]?[0-9.eE]*)?')
+
+# Decimal points and exponents of a number.
+_NUMBER_MARK_RE = re.compile(rb'[.eE]')
+
+# UTF-8 continuation bytes.
+_CONTINUATION_RE = re.compile(rb'[\x80-\xbf]*')
+
+# A single UTF-8 encoded character.
+_CHARACTER_RE = re.compile(rb'.[\x80-\xbf]*', re.DOTALL)
+
+_NEWLINE_RE = re.compile(rb'\n')
+
+# Interned text of every keyword and symbol, so that comparing it with the
+# parser's string constants is an identity check.
+_INTERNED = {token: sys.intern(token.decode()) for token
+             in list(_KEYWORD_TYPES) + [bytes([c]) for c in _SYMBOLS] +
+             _LONG_SYMBOL_LIST}
+
+# Kinds of token which can start with a given character.
+_SPACE, _NAME, _NUMBER, _QUOTE, _BRACKET, _SYMBOL = range(6)
+
+
+def _dispatch(character: str) -> int:
+    """
+    Get the kind of token starting with the given ASCII character.
+    :param character: First character of a token.
+    :return: One of the '_SPACE', '_NAME', ... constants.
+    """
+    if character.isspace():
+        return _SPACE
+    elif character in string.digits:
+        return _NUMBER
+    elif character in string.ascii_letters + '_':
+        return _NAME
+    elif character in {'"', '\''}:
+        return _QUOTE
+    elif character == '[':
+        return _BRACKET
+    return _SYMBOL
+
+
+# Kind of token starting with each byte. Non-ASCII characters never start a
+# valid token.
+_DISPATCH = tuple(_dispatch(chr(i)) if i < 128 else _SYMBOL
+                  for i in range(256))
+
+# A run of characters which cannot start any token.
+_INVALID_RE = re.compile(rb'(?:[' + b''.join(
+    re.escape(bytes([i])) for i in range(128)
+    if _DISPATCH[i] == _SYMBOL and i not in _SYMBOLS and
+    i not in _LONG_SYMBOLS) + rb'\x80-\xff][\x80-\xbf]*)*')
+
+
+def _first_word(source: bytes) -> str:
+    """
+    Get the first whitespace separated word, counting every character for
+    which 'str.isspace' is true as whitespace. Bytes which are not valid
+    UTF-8 are decoded as lone surrogates, so the word encodes back to the
+    original bytes with the 'surrogateescape' error handler.
+    :param source: Part of the contents of a file.
+    :return: The word or "" if there are no words.
+    """
+    words = source.decode(errors='surrogateescape').split(maxsplit=1)
+    if len(words) == 0:
+        return ""
+    return words[0]
+
+
+def _skip_characters(source: bytes, pos: int, n: int) -> int:
+    """
+    Get the position the given number of characters after a position.
+    :param source: The contents of a file.
+    :param pos: Position to start counting from.
+    :param n: Number of characters to skip.
+    :return: The position, never inside a UTF-8 encoded character.
+    """
+    # A character is at most four bytes long.
+    text = source[pos:pos + 4 * n].decode(errors='surrogateescape')
+    end = pos + len(text[:n].encode(errors='surrogateescape'))
+    match = _CONTINUATION_RE.match(source, end)
+    assert match is not None  # The pattern matches the empty string.
+    return match.end()
 
 
 class Lexer:
@@ -24,8 +150,15 @@ class Lexer:
     def __init__(self, e: ErrorStore):
         self._e = e  # ErrorStore.
         self._line = 0  # Current line number.
-        self._iterator = self.iterator()  # Iterator over file.
-        self._skip = 0  # Number of letters to skip iterating over.
+
+        with open(self._e.filename, 'rb') as file:
+            # Contents of the file with universal newlines.
+            self._source = file.read().replace(b'\r\n', b'\n') \
+                .replace(b'\r', b'\n')
+
+        # Positions of all line breaks in the file.
+        self._newlines = [match.start() for match
+                          in _NEWLINE_RE.finditer(self._source)]
 
     def e(self, msg: str):
         """
@@ -34,232 +167,221 @@ class Lexer:
         """
         self._e.report(self._line, msg)
 
-    def iterator(self) -> LexIterator:
+    def string(self, source: bytes, pos: int) -> tuple[bytes, int, int]:
         """
-        Get an iterator for the file.
-        :return: Iterator over input file.
+        Check if the input has a valid Lua string at the given position.
+        :param source: The contents of a file.
+        :param pos: Position of the first character of the string.
+        :return: The Lua string, its token type and the position after it.
         """
-        line_number = 1
-        increment_line_number = False
-
-        with open(self._e.filename) as file:
-            source = file.read()
-
-        for position, character in enumerate(source):
-            if increment_line_number:
-                increment_line_number = False
-                line_number += 1
-
-            if character == '\n':
-                increment_line_number = True
-
-            yield line_number, character, source[position:]
-
-    def string(self, source: str) -> Tuple[str, TokenType]:
-        """
-        Check if the beginning of the input has a valid Lua string.
-        :param source: A string of characters.
-        :return: The Lua string and its token type.
-        """
-        bracket = source[0]
-        val = source[1:]
+        bracket = source[pos:pos + 1]
+        start = pos + 1  # Position of the first character after 'bracket'.
         token = bracket
 
-        if bracket == '[':
+        if bracket == b'[':
             # Long string.
-            try:
-                bracket, val = val.split('[', 1)
-            except ValueError:
+            end = source.find(b'[', start)
+            if end == -1:
                 self.e("String does not have a second '[' symbol.")
-                bracket = ""
-                for c in val:
-                    if c != "=":
-                        break
-                    bracket += "="
-                val = val[len(bracket):]
-                self._skip -= 1
-
-            if set(bracket) != {'='} and bracket != "":
-                self.e("Symbols other than '=' between initial '['.")
-                temp = ""
-                for _ in bracket:
-                    temp += "="
-                bracket = temp
+                end = start
+                while source[end:end + 1] == b"=":
+                    end += 1
+                bracket = source[start:end]
+                start = end
+            else:
+                bracket = source[start:end]
+                start = end + 1
 
-            token += bracket + '['
-            bracket = ']' + bracket + ']'
+            if bracket.strip(b"="):
+                self.e("Symbols other than '=' between initial '['.")
+                # One '=' for every character, not every byte.
+                bracket = b"=" * len(bracket.decode(errors='surrogateescape'))
 
-            val = val.split(bracket, 1)
+            token += bracket + b'['
+            bracket = b']' + bracket + b']'
 
-            if len(val) == 1:
+            end = source.find(bracket, start)
+            if end == -1:
                 self.e("String not closed.")
-                val = val[0].split()
-                if len(val) == 0:
-                    val = ['']
-                self._skip -= len(bracket)
+                word = _first_word(source[start:])
+                val = word.encode(errors='surrogateescape')
+                end = _skip_characters(source, start, len(word))
+            else:
+                val = source[start:end]
+                end += len(bracket)
 
-            token += val[0] + bracket
+            token += val + bracket
 
-            if len(token.split("[" + bracket[1:-1] + "[")) > 2:
+            if len(token.split(b"[" + bracket[1:-1] + b"[")) > 2:
                 self.e("Long brackets are nested.")
 
-            return token, TokenType.str
+            return token, STR, end
         else:
             escaped = False  # True if the previous character was an escape.
+            parts = [bracket]  # Characters of the string so far.
+            illegal = 0  # Number of illegal escapes.
 
-            for c in val:
+            for position in range(start, len(source)):
+                c = source[position:position + 1]
                 if escaped:
-                    escapes = {'a', 'b', 'f', 'n', 'r', 't', 'v', '\\', '\"',
-                               '\''}
-                    if c not in escapes and not re.match('[0-9]', c):
-                        self.e("Illegal escape in string.")
-                        token += "\\"
-                        self._skip -= 1
+                    if c not in _ESCAPES and not c.isdigit():
+                        parts.append(b"\\")
+                        illegal += 1
                     escaped = False
 
-                elif c == '\\':
+                elif c == b'\\':
                     escaped = True
 
                 elif c == bracket:
-                    return token + bracket, TokenType.str
+                    if illegal:
+                        self._e.report_many(self._line,
+                                            [_ILLEGAL_ESCAPE] * illegal)
+                    parts.append(bracket)
+                    return b"".join(parts), STR, position + 1
 
-                token += c
+                parts.append(c)
 
+            if illegal:
+                self._e.report_many(self._line, [_ILLEGAL_ESCAPE] * illegal)
             self.e("String not closed.")
-            token = token.split()
-            if len(token) == 0:
-                token = ['']
-            self._skip -= len(bracket)
-            return token[0] + bracket, TokenType.str
+            word = _first_word(b"".join(parts))
+            # Always consume at least the opening quote.
+            end = max(_skip_characters(source, pos, len(word) - illegal),
+                      pos + 1)
+            return word.encode(errors='surrogateescape') + bracket, STR, end
 
-    def number(self, source: str) -> Tuple[str, TokenType]:
+    def number(self, source: bytes, pos: int) -> tuple[bytes, int, int]:
         """
-        Check if the beginning of the input has a valid Lua number.
-        :param source: A string of characters.
-        :return: The Lua number and its token type.
+        Check if the input has a valid Lua number at the given position.
+        :param source: The contents of a file.
+        :param pos: Position of the first character of the number.
+        :return: The Lua number, its token type and the position after it.
         """
-        token = ""
-
-        if source.startswith("0x"):
-            # Hexadecimal.
-            token = "0x"
-            for c in source[2:]:
-                if not re.match('[0-9a-fA-F]', c):
-                    break
-                token += c
-
-        else:
-            decimal = False  # The '.' character has been encountered.
-            exponent = False  # 'E' or 'e' have been encountered.
-            after_exponent = False  # 'E' or 'e' have just been encountered.
-
-            for c in source:
-                if not after_exponent and c in {'+', '-'}:
-                    break
-                after_exponent = False
+        match = _NUMBER_RE.match(source, pos)
+        assert match is not None  # The pattern matches the empty string.
+        token = match.group()
+        end = pos + len(token)
+
+        if token.startswith(b"0x") or \
+                source[end:end + 1] not in _NUMBER_ERRORS:
+            return token, NUM, end
+
+        # Multiple decimal points or exponents. Only the first of each is
+        # kept, the others are reported and dropped.
+        match = _MALFORMED_NUMBER_RE.match(source, pos)
+        assert match is not None  # The pattern matches the empty string.
+        end = match.end()
+        parts = []  # Pieces of the number between dropped characters.
+        start = pos  # Position of the first character of the current piece.
+        decimal = False  # The '.' character has been encountered.
+        exponent = False  # 'E' or 'e' have been encountered.
+
+        for match in _NUMBER_MARK_RE.finditer(source, pos, end):
+            if match.group() == b'.':
+                if decimal:
+                    self.e("Decimal point occurs multiple times.")
+                    parts.append(source[start:match.start()])
+                    start = match.end()
+                decimal = True
 
-                try:
-                    if c == '.':
-                        if decimal:
-                            raise LexEx("Decimal point occurs multiple times.")
-                        decimal = True
-
-                    elif c in {'e', 'E'}:
-                        if exponent:
-                            raise LexEx("Multiple exponents in number.")
-                        exponent = True
-                        after_exponent = True
-
-                    elif not re.match('[0-9]', c) and c not in {'+', '-'}:
-                        break
-
-                    token += c
-                except LexEx as e:
-                    self.e(e.msg)
-                    self._skip += 1
+            else:
+                if exponent:
+                    self.e("Multiple exponents in number.")
+                    parts.append(source[start:match.start()])
+                    start = match.end()
+                exponent = True
 
-        return token, TokenType.num
+        parts.append(source[start:end])
+        return b"".join(parts), NUM, end
 
     @staticmethod
-    def name(source: str) -> Tuple[str, TokenType]:
-        """
-        Check if the beginning of the input has a valid Lua name or keyword.
-        :param source: A string of characters.
-        :return: The Lua name or keyword and its token type.
-        """
-        keywords = {'and', 'break', 'do', 'else', 'elseif', 'end', 'false',
-                    'for', 'function', 'if', 'in', 'local', 'nil', 'not', 'or',
-                    'repeat', 'return', 'then', 'true', 'until', 'while'}
-        token = ""
-
-        for c in source:
-            if not re.match('[0-9a-zA-Z_]', c):
-                break
-            token += c
-
-        if token in keywords:
-            return token, TokenType.key
-        else:
-            return token, TokenType.name
-
-    def symbols(self, source: str) -> Tuple[str, TokenType]:
+    def name(source: bytes, pos: int) -> tuple[bytes, int, int]:
         """
-        Check if the beginning of the input has a valid Lua symbol.
-        :param source: A string of characters.
-        :return: The Lua symbol and its token type.
+        Check if the input has a valid Lua name or keyword at the given
+        position.
+        :param source: The contents of a file.
+        :param pos: Position of the first character of the name.
+        :return: The Lua name or keyword, its token type and the position
+        after it.
         """
-        symbols = {"+", "-", "*", "/", "%", "^", "#", "(", ")", "{", "}", "[",
-                   "]", ";", ":", ","}
-
-        if source[0] in symbols:
-            return source[0], TokenType.sym
-
-        long_symbols = ["...", "..", ".", "==", "~=", "<=", "=", ">=", "<",
-                        ">"]
-        for symbol in long_symbols:
-            if source.startswith(symbol):
-                return symbol, TokenType.sym
+        match = _NAME_RE.match(source, pos)
+        assert match is not None  # Only called on a letter or '_'.
+        token = match.group()
+        return token, _KEYWORD_TYPES.get(token, NAME), \
+            pos + len(token)
 
-        self.e("'" + source[0] + "' does not start a valid token.")
-        return source[0], TokenType.invalid
-
-    def skip(self, n: int):
+    def symbols(self, source: bytes, pos: int) -> tuple[bytes, int, int]:
         """
-        Increment the iterator.
-        :param n: The number of times in addition to 'self._skip' the iterator
-        should be incremented.
+        Check if the input has a valid Lua symbol at the given position.
+        :param source: The contents of a file.
+        :param pos: Position of the first character of the symbol.
+        :return: The Lua symbol, its token type and the position after it.
+        Other characters are returned with the invalid type.
         """
-        while n + self._skip:
-            next(self._iterator)
-            n -= 1
-
-        self._skip = 0
+        if source[pos] in _SYMBOLS:
+            return source[pos:pos + 1], SYM, pos + 1
+
+        # Find the longest symbol starting at 'pos'.
+        node = _LONG_SYMBOLS
+        symbol = None
+        for c in source[pos:pos + 3]:
+            child = node.get(c)
+            if child is None:
+                break
+            node = child
+            symbol = node.get(None, symbol)
+
+        if symbol is not None:
+            return symbol, SYM, pos + len(symbol)
+
+        # Consume the whole run of invalid characters at once.
+        match = _CHARACTER_RE.match(source, pos)
+        assert match is not None  # 'pos' is not at the end of 'source'.
+        match = _INVALID_RE.match(source, match.end())
+        assert match is not None  # The pattern matches the empty string.
+        end = match.end()
+        errors = []  # Messages for the characters of the run.
+        for character in _CHARACTER_RE.findall(source, pos, end):
+            character = character.decode(errors='replace')
+            if not character.isspace():
+                errors.append("'" + character +
+                              "' does not start a valid token.")
+        self._e.report_many(self._line, errors)
+        return source[pos:end], INVALID, end
 
     def lexer(self) -> TokenIterator:
         """
         Performs lexing and returns an iterator over tokens.
         :return: An iterator over tokens.
         """
-        for self._line, character, remainder in self._iterator:
-            if character.isspace():
+        source = self._source
+        pos = 0  # Position of the current character.
+
+        while pos < len(source):
+            kind = _DISPATCH[source[pos]]
+
+            if kind == _SPACE:
+                pos += 1
                 continue
 
-            elif re.match('[a-zA-Z_]', character):
-                token, token_type = self.name(remainder)
+            self._line = bisect.bisect_left(self._newlines, pos) + 1
 
-            elif re.match('[0-9]', character):
-                token, token_type = self.number(remainder)
+            if kind == _NAME:
+                token, token_type, pos = self.name(source, pos)
 
-            elif (character == '"' or
-                    character == '\'' or
-                    remainder.startswith('[=') or
-                    remainder.startswith('[[')):
-                token, token_type = self.string(remainder)
+            elif kind == _NUMBER:
+                token, token_type, pos = self.number(source, pos)
 
-            else:
-                token, token_type = self.symbols(remainder)
+            elif (kind == _QUOTE or
+                    kind == _BRACKET and (source.startswith(b'[=', pos) or
+                                          source.startswith(b'[[', pos))):
+                token, token_type, pos = self.string(source, pos)
 
-            self.skip(len(token) - 1)
+            else:
+                token, token_type, pos = self.symbols(source, pos)
 
-            if token_type != TokenType.invalid:
-                yield token, token_type, self._line
+            if token_type != INVALID:
+                text = _INTERNED.get(token)
+                if text is None:
+                    text = token.decode(errors='replace')
+                yield text, token_type, self._line
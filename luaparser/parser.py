@@ -2,25 +2,81 @@
 
 """Lua parser for CS325."""
 
-from luaparser.types import TokenIterator, Tokens, TokenType, ErrorStore
-from difflib import SequenceMatcher
-
-
-class EllipsisException(Exception):
-    """When 'namelist()' encounters an ellipsis. Caught by funcbody()."""
-
-    def __init__(self, msg: str, line: int, params: [str]):
-        """
-        :param msg: Message to be displayed to the user.
-        :param line: The line number of the token creating the exception.
-        :param params: List of names in the namelist so far.
-        """
-        super().__init__(msg, line)
-        self._params = params
+from __future__ import annotations
 
-    @property
-    def get_params(self):
-        return self._params
+from collections.abc import Callable, Iterable
+from luaparser.types import Token, Tokens, ErrorStore, NAME, STR, NUM, KEY
+from difflib import SequenceMatcher
+import functools
+import sys
+
+# Operators. Multi-character symbols are interned so that they are the same
+# objects as the token text produced by the lexer.
+_UNARY = frozenset({'-', 'not', '#'})
+_BINOPS = frozenset(map(sys.intern, {'+', '-', '*', '/', '^', '%', '..', '<',
+                                     '<=', '>', '>=', '==', '~=', 'and',
+                                     'or'}))
+
+# Variable arguments symbol.
+_VARARG = sys.intern("...")
+
+# Values consisting of a single keyword or symbol.
+_VALUE_LITERALS = frozenset({"nil", "false", "true", _VARARG})
+
+# Tokens closing a chunk.
+_END = frozenset({"end"})
+_UNTIL = frozenset({"until"})
+_END_IF = frozenset({"elseif", "else", "end"})
+
+# Symbols separating fields of a table.
+_FIELD_SEPARATORS = frozenset({',', ';'})
+
+# Symbols starting an index or a call.
+_INDEX = frozenset({'[', '.'})
+_CALL = frozenset({'(', '{', ':'})
+
+# Symbols which may follow the first name of an assignment.
+_ASSIGNMENT = frozenset({',', '='})
+
+# Used where no token can close the current chunk.
+_NO_TOKENS: frozenset[str] = frozenset()
+
+# Keywords starting a statement.
+_STATEMENTS = frozenset({"do", "while", "repeat", "if", "for", "function",
+                         "local"})
+
+@functools.lru_cache(maxsize=1024)
+def _best_match(token: str | None, candidates: frozenset[str],
+                similar: float) -> str:
+    """
+    Find the candidate most similar to a token.
+    :param token: The token value or None at the end of the file.
+    :param candidates: Token values which were expected instead of the token.
+    :param similar: How similar two strings must be to be considered a typo.
+    :return: The most similar candidate or "" if none is similar enough.
+    """
+    if token is None:
+        return ""
+    if token in candidates:
+        return token
+
+    best_match = ""
+
+    # Only a ratio above both 'similar' and the best ratio so far matters,
+    # so try the cheap upper bounds of the ratio first.
+    maximum = similar
+    matcher = SequenceMatcher(None, token)
+    for expected in candidates:
+        matcher.set_seq2(expected)
+
+        if matcher.real_quick_ratio() > maximum \
+                and matcher.quick_ratio() > maximum:
+            temp = matcher.ratio()
+            if temp > maximum:
+                maximum = temp
+                best_match = expected
+
+    return best_match
 
 
 class EndOfScopeException(Exception):
@@ -29,21 +85,37 @@ class EndOfScopeException(Exception):
 
 
 class Parser:
-    """Class for turning a TokenIterator into a list of errors or declared
-    functions in case of no errors."""
+    """Class for turning a list of tokens into a list of errors or declared
+    functions in case of no errors.
+
+    Productions choose their alternative from the current token and at most
+    one token of lookahead and never backtrack, so no production is parsed
+    twice at the same token and there is nothing to memoize."""
 
-    def __init__(self, e: ErrorStore, ti: TokenIterator):
-        self._functions = dict([])  # All functions declared so far.
+    def __init__(self, e: ErrorStore, tokens: Iterable[Token]):
+        # All functions declared so far and their parameters.
+        self._functions: dict[str, list[str]] = {}
         self._lastfunction = ""  # Name of the functions being declared.
         self._unnamed_function = 0  # Number of declared unnamed functions.
         self._e = e  # ErrorStore.
-        self._t = Tokens(ti)  # Iterator over tokens.
+        self._t = Tokens(tokens)  # Tokens being parsed.
+        self._sm = SequenceMatcher()  # Used for finding typos.
+
+        # Methods parsing the stat started by a keyword.
+        self._stat_handlers: dict[str | None, Callable[[], None]] = {
+            "do": self._stat_do,
+            "while": self._stat_while,
+            "repeat": self._stat_repeat,
+            "if": self._stat_if,
+            "function": self._stat_function,
+            "local": self._stat_local,
+            "for": self._stat_for}
 
         # Constant setting of how similar two strings must be
         # to be considered a typo.
         self.SIMILAR = 0.65
 
-    def e(self, expected: str, msg="expected"):
+    def e(self, expected: str, msg: str = "expected"):
         """
         Store an error at the current location. If similar to the expected
         value, increment iterator.
@@ -53,14 +125,20 @@ class Parser:
         """
         if expected != "":
             msg = "'" + expected + "' " + msg
-            if SequenceMatcher(None, self.t.get_t, expected).ratio() \
-                    > self.SIMILAR:
-                self.t.next()
+            t = self.t.get_t
+            # Nothing is similar to the end of the file.
+            if t is not None:
+                self._sm.set_seqs(t, expected)
+                if self._sm.real_quick_ratio() > self.SIMILAR \
+                        and self._sm.quick_ratio() > self.SIMILAR \
+                        and self._sm.ratio() > self.SIMILAR:
+                    self.t.next()
 
         msg = "'" + str(self.t.get_t) + "' not expected. " + msg + "."
         self._e.report(self.t.line, msg)
 
-    def e_set(self, expectation: set, increment: bool, msg="") -> str:
+    def e_set(self, expectation: frozenset[str], increment: bool,
+              msg: str = "") -> str:
         """
         Store an error at the current location. If similar to an expected
         value, return value.
@@ -73,19 +151,8 @@ class Parser:
         best_match = ""
 
         if len(expectation) > 0:
-            maximum = 0
-            for expected in expectation:
-                if expected is not None:
-                    temp = SequenceMatcher(None, self.t.get_t, expected) \
-                        .ratio()
-
-                if temp > maximum:
-                    maximum = temp
-                    best_match = expected
-
-            if maximum <= self.SIMILAR:
-                best_match = ""
-            elif increment:
+            best_match = _best_match(self.t.get_t, expectation, self.SIMILAR)
+            if best_match != "" and increment:
                 self.t.next()
         if msg != "":
             msg += "."
@@ -94,7 +161,7 @@ class Parser:
 
     def var(self):
         """Parse Lua var."""
-        if not self.varorfunctioncall(False, set()):
+        if not self.varorfunctioncall(False, _NO_TOKENS):
             self.e("", "Variable expected")
 
     def index(self):
@@ -104,7 +171,7 @@ class Parser:
 
         elif self.t.match("["):
             self.exp()
-            if self.t.nmatch("]"):
+            if not self.t.match("]"):
                 self.e("]")
 
         else:
@@ -112,17 +179,17 @@ class Parser:
 
     def tableconstructor(self):
         """Parse Lua tableconstructor."""
-        if self.t.nmatch("{"):
+        if not self.t.match("{"):
             self.e("{")
 
-        if self.t.nmatch("}"):
+        if not self.t.match("}"):
             self.field()
-            while self.t.match_set({',', ';'}):
+            while self.t.match_set(_FIELD_SEPARATORS):
                 if self.t.get_t == "}":
                     break
                 self.field()
 
-            if self.t.nmatch("}"):
+            if not self.t.match("}"):
                 self.e("}")
 
     def call(self):
@@ -130,11 +197,11 @@ class Parser:
         if self.t.match(":"):
             self.name()
 
-        if self.t.nmatch_type(TokenType.str):
+        if not self.t.match_type(STR):
             if self.t.match("("):
-                if self.t.nmatch(")"):
+                if not self.t.match(")"):
                     self.explist()
-                    if self.t.nmatch(")"):
+                    if not self.t.match(")"):
                         self.e(")")
 
             elif self.t.get_t == "{":
@@ -147,10 +214,10 @@ class Parser:
         """Parse Lua field."""
         if self.t.match("["):
             self.exp()
-            if self.t.nmatch("]"):
+            if not self.t.match("]"):
                 self.e("]")
 
-        elif self.t.get_tt is TokenType.name and self.t.lookahead == "=":
+        elif self.t.get_tt == NAME and self.t.lookahead == "=":
             self.t.next()
             self.t.next()
             self.exp()
@@ -160,8 +227,8 @@ class Parser:
 
     def sufix(self):
         """Parse Lua sufix."""
-        if self.t.nmatch_type(TokenType.str):
-            if self.t.match_set({'[', '.'}):
+        if not self.t.match_type(STR):
+            if self.t.match_set(_INDEX):
                 self.index()
 
             else:
@@ -171,7 +238,7 @@ class Parser:
         """Parse Lua prefix."""
         if self.t.match("("):
             self.exp()
-            if self.t.nmatch(")"):
+            if not self.t.match(")"):
                 self.e(")")
 
         else:
@@ -179,9 +246,9 @@ class Parser:
 
     def value(self):
         """Parse Lua value."""
-        if self.t.nmatch_set({"nil", "false", "true", "..."}) \
-                and self.t.nmatch_type(TokenType.num) \
-                and self.t.nmatch_type(TokenType.str):
+        if not self.t.match_set(_VALUE_LITERALS) \
+                and not self.t.match_type(NUM) \
+                and not self.t.match_type(STR):
 
             if self.t.match("function"):
                 self.funcbody()
@@ -190,7 +257,7 @@ class Parser:
                 self.tableconstructor()
 
             else:
-                self.varorfunctioncall(True, set())
+                self.varorfunctioncall(True, _NO_TOKENS)
 
     def explist(self):
         """Parse Lua explist."""
@@ -211,43 +278,42 @@ class Parser:
             self.e("", "Function '" + self._lastfunction +
                    "' defined multiple times")
 
-        self._functions[self._lastfunction] = []
+        params: list[str] = []  # Parameters of the function.
+        self._functions[self._lastfunction] = params
 
-        if self.t.nmatch("("):
+        if not self.t.match("("):
             self.e("(", "expected in function '" + self._lastfunction + "'")
 
-        if self.t.nmatch(")"):
-            if self.t.match("..."):
-                self._functions[self._lastfunction].append("...")
+        if not self.t.match(")"):
+            if self.t.match(_VARARG):
+                params.append(_VARARG)
 
             else:
-                try:
-                    self._functions[self._lastfunction] += self.namelist()
-
-                except EllipsisException as e:
-                    self._functions[self._lastfunction] += e.get_params
-                    self._functions[self._lastfunction].append("...")
+                names, ellipsis = self.namelist()
+                params.extend(names)
+                if ellipsis:
+                    params.append(_VARARG)
 
-            if self.t.nmatch(")"):
+            if not self.t.match(")"):
                 self.e(")", "expected in function '" + self._lastfunction +
                        "'")
 
             self._lastfunction = ""
-            self.chunk({"end"})
+            self.chunk(_END)
 
-    def namelist(self) -> [str]:
+    def namelist(self) -> tuple[list[str], bool]:
         """
         Parse Lua namelist.
-        :return: List of encountered names.
+        :return: List of encountered names and True if the list was ended
+        by '...'.
         """
         temp = [self.name()]
         while self.t.match(","):
-            if self.t.match("..."):
-                raise EllipsisException("'...' encountered in namelist",
-                                        self.t.line, temp)
+            if self.t.match(_VARARG):
+                return temp, True
 
             temp.append(self.name())
-        return temp
+        return temp, False
 
     def name(self) -> str:
         """
@@ -255,122 +321,134 @@ class Parser:
         :return: The encountered name.
         """
         temp = self.t.get_t
-        if self.t.nmatch_type(TokenType.name):
-            self.e("", "'" + temp + "' is not a valid name")
+        if not self.t.match_type(NAME):
+            self.e("", "'" + str(temp) + "' is not a valid name")
 
+        if temp is None:
+            return ""
         return temp
 
     def funcname(self):
         """Parse Lua funcname and save it."""
-        self._lastfunction = ""
-        self._lastfunction += self.name()
+        parts = [self.name()]  # Names and separators making up the name.
         while self.t.match("."):
-            self._lastfunction += "."
-            self._lastfunction += self.name()
+            parts.append(".")
+            parts.append(self.name())
 
         if self.t.match(":"):
-            self._lastfunction += ":"
-            self._lastfunction += self.name()
+            parts.append(":")
+            parts.append(self.name())
+
+        self._lastfunction = "".join(parts)
 
     def exp(self):
         """Parse Lua exp."""
-        if self.t.match_set({"-", "not", "#"}):
+        if self.t.match_set(_UNARY):
             self.exp()
 
         else:
             self.value()
-            binop = {'+', '-', '*', '/', '^', '%', '..', '<', '<=', '>', '>=',
-                     '==', '~=', 'and', 'or'}
 
-            if self.t.match_set(binop):
+            if self.t.match_set(_BINOPS):
                 self.exp()
 
-    def stat(self, cond: set):
+    def stat(self, cond: frozenset[str]):
         """
         Parse Lua stat.
         :param cond: Set of strings, which could end the scope of the current
         chunk.
         """
-        if self.t.match("do"):
-            self.chunk({"end"})
-
-        elif self.t.match("while"):
-            self.exp()
-            if self.t.nmatch("do"):
-                self.e("do", "not found after 'while'")
+        handler = self._stat_handlers.get(self.t.get_t)
+        if handler is not None:
+            self.t.next()
+            handler()
 
-            self.chunk({"end"})
+        elif self.varorfunctioncall(False, cond):
+            # varlist
+            while self.t.match(','):
+                self.var()
 
-        elif self.t.match("repeat"):
-            self.chunk({"until"})
-            self.exp()
+            if self.t.match('='):
+                self.explist()
 
-        elif self.t.match("if"):
-            self.exp()
-            if self.t.nmatch("then"):
-                self.e("then", "not found after 'if'")
+            else:
+                self.e('=')
 
-            temp = self.chunk({"elseif", "else", "end"})
-            while temp == "elseif":
-                self.exp()
-                if self.t.nmatch("then"):
-                    self.e("then", "not found after 'else'")
-                temp = self.chunk({"elseif", "else", "end"})
-            if temp == "else":
-                self.chunk({"end"})
-
-        elif self.t.match("function"):
-            self.funcname()
-            self.funcbody()
+    def _stat_do(self):
+        """Parse Lua 'do' stat after the keyword."""
+        self.chunk(_END)
 
-        elif self.t.match("local"):
-            if self.t.match("function"):
-                self._lastfunction = self.name()
-                self.funcbody()
-            else:
-                try:
-                    self.namelist()
-                except EllipsisException as e:
-                    self.e("", e.args[0])
-                if self.t.match("="):
-                    self.explist()
+    def _stat_while(self):
+        """Parse Lua 'while' stat after the keyword."""
+        self.exp()
+        if not self.t.match("do"):
+            self.e("do", "not found after 'while'")
 
-        elif self.t.match("for"):
-            self.name()
-            if self.t.match("="):
-                self.exp()
-                if self.t.nmatch(","):
-                    self.e(",", "expected in 'for' loop")
+        self.chunk(_END)
 
-                self.exp()
-                if self.t.match(","):
-                    self.exp()
-            else:
-                while self.t.match(","):
-                    self.name()
+    def _stat_repeat(self):
+        """Parse Lua 'repeat' stat after the keyword."""
+        self.chunk(_UNTIL)
+        self.exp()
 
-                if self.t.nmatch("in"):
-                    self.e("in", "expected in 'for' loop")
+    def _stat_if(self):
+        """Parse Lua 'if' stat after the keyword."""
+        self.exp()
+        if not self.t.match("then"):
+            self.e("then", "not found after 'if'")
 
+        temp = self.chunk(_END_IF)
+        while temp == "elseif":
+            self.exp()
+            if not self.t.match("then"):
+                self.e("then", "not found after 'else'")
+            temp = self.chunk(_END_IF)
+        if temp == "else":
+            self.chunk(_END)
+
+    def _stat_function(self):
+        """Parse Lua 'function' stat after the keyword."""
+        self.funcname()
+        self.funcbody()
+
+    def _stat_local(self):
+        """Parse Lua 'local' stat after the keyword."""
+        if self.t.match("function"):
+            self._lastfunction = self.name()
+            self.funcbody()
+        else:
+            _, ellipsis = self.namelist()
+            if ellipsis:
+                self.e("", "'...' encountered in namelist")
+            if self.t.match("="):
                 self.explist()
 
-            if self.t.nmatch("do"):
-                self.e("do", "expected in 'for' loop")
+    def _stat_for(self):
+        """Parse Lua 'for' stat after the keyword."""
+        self.name()
+        if self.t.match("="):
+            self.exp()
+            if not self.t.match(","):
+                self.e(",", "expected in 'for' loop")
 
-            self.chunk({"end"})
+            self.exp()
+            if self.t.match(","):
+                self.exp()
+        else:
+            while self.t.match(","):
+                self.name()
 
-        elif self.varorfunctioncall(False, cond):
-            # varlist
-            while self.t.match(','):
-                self.var()
+            if not self.t.match("in"):
+                self.e("in", "expected in 'for' loop")
 
-            if self.t.match('='):
-                self.explist()
+            self.explist()
 
-            else:
-                self.e('=')
+        if not self.t.match("do"):
+            self.e("do", "expected in 'for' loop")
+
+        self.chunk(_END)
 
-    def varorfunctioncall(self, exp: bool, cond: set) -> bool:
+    def varorfunctioncall(self, exp: bool, cond: frozenset[str]) -> bool:
         """
         Parse a Lua var, functioncall or '(' exp ')'.
         :param exp: True if '(' exp ')' production permitted.
@@ -381,8 +459,8 @@ class Parser:
         name = False
         t, tt = self.t.lookahead_ttt
 
-        if self.t.get_tt is TokenType.name:
-            if t in {",", "="}:
+        if self.t.get_tt == NAME:
+            if t in _ASSIGNMENT:
                 self.t.next()
                 return True
             name = True
@@ -400,12 +478,12 @@ class Parser:
 
         isvar = False
 
-        if t in {'[', '.'}:
+        if t in _INDEX:
             self.t.next()
             self.index()
             isvar = True
 
-        elif t in {'(', '{', ':'} or tt is TokenType.str:
+        elif t in _CALL or tt == STR:
             self.t.next()
             self.call()
             isvar = False
@@ -417,47 +495,50 @@ class Parser:
             if name:
                 best_match = self.e_set(cond, False)
                 if best_match != "":
-                    self._e.report(self.t.line, "Typo in '" + self.t.get_t +
+                    self._e.report(self.t.line, "Typo in '" +
+                                   str(self.t.get_t) +
                                    "' - should probably be '" + best_match +
                                    "'.")
                     self.t.next()
                     raise EndOfScopeException(best_match)
 
-                best_match = self.e_set({"do", "while", "repeat", "if", "for",
-                                         "function", "local"}, False)
+                best_match = self.e_set(_STATEMENTS, False)
 
                 if best_match != "":
-                    self._e.report(self.t.line, "Typo in '" + self.t.get_t +
+                    self._e.report(self.t.line, "Typo in '" +
+                                   str(self.t.get_t) +
                                    "' - should probably be '" + best_match +
                                    "'.")
-                    self.t.set_t(best_match, TokenType.key)
+                    self.t.set_t(best_match, KEY)
                     return False
 
             self.t.next()
             self.e("", "'[', '.', '(', '{', ':' or a string expected")
 
         while True:
-            if self.t.get_t in {'[', '.'}:
+            if self.t.get_t in _INDEX:
                 self.index()
                 isvar = True
 
-            elif self.t.get_t in {'(', '{', ':'} \
-                    or self.t.get_tt is TokenType.str:
+            elif self.t.get_t in _CALL or self.t.get_tt == STR:
                 self.call()
                 isvar = False
 
             else:
                 return isvar
 
-    def chunk(self, cond: set) -> str:
+    def chunk(self, cond: frozenset[str], eof: bool = False) -> str | None:
         """
         Parse a Lua chunk.
         :param cond: Set of tokens, which can close this chunk.
+        :param eof: True if the end of the file can close this chunk.
         :return: The last token of the chunk.
         """
         broken = False
         while self.t.get_t not in cond:
             if self.t.get_t is None:
+                if eof:
+                    break
                 self.e("", "Scope not closed")
                 return ""
             if broken:
@@ -483,10 +564,7 @@ class Parser:
     def parser(self):
         """Displays a list of errors or declared functions
         in case of no errors."""
-        try:
-            self.chunk({"end", None})
-        except EllipsisException as e:
-            self.e("", e.args[0])
+        self.chunk(_END, True)
 
         if self._e.error_count:
             self._e.print_errors()
@@ -496,6 +574,6 @@ class Parser:
                 print(f, self._functions[f])
 
     @property
-    def t(self):
+    def t(self) -> Tokens:
         """Gets the Tokens object for this class."""
         return self._t
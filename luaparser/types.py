@@ -1,36 +1,15 @@
 # coding=utf-8
 """Type definitions."""
 
-from enum import Enum
-import itertools
+from __future__ import annotations
 
-try:
-    from typing import Iterator, Tuple, Sequence
-except ImportError:
-    class DummyType(type):
-        """Metaclass used to provide backward compatibility with Python 3.4."""
+import sys
+from collections.abc import Iterable, Iterator
 
-        def __getitem__(self, item):
-            return item
 
-
-    class Sequence(metaclass=DummyType):
-        """Class used to provide backward compatibility with Python 3.4."""
-        pass
-
-
-    class Tuple(metaclass=DummyType):
-        """Class used to provide backward compatibility with Python 3.4."""
-        pass
-
-
-    class Iterator(metaclass=DummyType):
-        """Class used to provide backward compatibility with Python 3.4."""
-        pass
-
-
-class TokenType(Enum):
-    """All the possible TokenTypes."""
+class TokenType:
+    """All the possible TokenTypes. Plain integers are used so that comparing
+    token types is a single integer comparison."""
     name = 1
     str = 2
     num = 3
@@ -39,28 +18,59 @@ class TokenType(Enum):
     invalid = 6
 
 
-# Iterates over input file - stores tuples containing the current line number,
-# the current character and the rest of the characters.
-LexIterator = Iterator[Tuple[int, str, str]]
+# The TokenType constants, importable without an attribute lookup.
+NAME = TokenType.name
+STR = TokenType.str
+NUM = TokenType.num
+KEY = TokenType.key
+SYM = TokenType.sym
+INVALID = TokenType.invalid
+
+
+# A tuple containing a token, its type and the line it was on in the original
+# file.
+Token = tuple[str, int, int]
 
-# Iterates over tokens - stores tuples containing the current token, its type
-# and the line it was on in the original file.
-TokenIterator = Iterator[Tuple[str, TokenType, int]]
+# Iterates over tokens.
+TokenIterator = Iterator[Token]
+
+# Token used after all tokens have been processed.
+EOFToken = tuple[None, None, None]
+_EOF: EOFToken = (None, None, None)
 
 
 class Tokens:
-    def __init__(self, tokens: TokenIterator):
+    __slots__ = ('_tokens', '_i', '_t', '_tt', '_line', '_next')
+
+    # The current token, which is None after all tokens have been processed.
+    _t: str | None
+    _tt: int | None
+    _line: int | None
+
+    def __init__(self, tokens: Iterable[Token]):
         """
-        Initializes Tokens by storing the iterator and the first token.
-        :param tokens: Iterator yielding tokens, their types and their line
-        numbers in the input file.
+        Initializes Tokens by reading all the tokens into a list and storing
+        the first token.
+        :param tokens: Tokens, their types and their line numbers in the
+        input file.
         """
-        self._tokens = tokens
-        self._t, self._tt, self._line = next(self._tokens, (None, None, None))
+        # Two '_EOF' tokens are appended, so that the current and the next
+        # token can always be read without checking the length.
+        self._tokens: list[Token | EOFToken] = list(tokens)
+        self._tokens += [_EOF, _EOF]
+        self._i = 0  # Index of the current token.
+        self._t, self._tt, self._line = self._tokens[0]
+        self._next = self._tokens[1]  # The token after the current one.
 
     def next(self):
-        """Increment the iterator."""
-        self._t, self._tt, self._line = next(self._tokens, (None, None, None))
+        """Move to the next token."""
+        self._i += 1
+        self._t, self._tt, self._line = self._next
+        try:
+            self._next = self._tokens[self._i + 1]
+        except IndexError:
+            # Already at the end, stay on the first '_EOF' token.
+            self._i -= 1
 
     def match(self, s: str) -> bool:
         """
@@ -73,34 +83,18 @@ class Tokens:
             return True
         return False
 
-    def nmatch(self, s: str) -> bool:
-        """
-        Increment iterator if string matches token.
-        :param s: String to match against current token.
-        :return: False if string matched.
-        """
-        return not self.match(s)
-
-    def match_type(self, tt: TokenType) -> bool:
+    def match_type(self, tt: int) -> bool:
         """
         Increment iterator if 'tt' matches the type of the current token.
-        :param tt: TokenType to match against the current one.
+        :param tt: TokenType constant to match against the current one.
         :return: True if string matched.
         """
-        if self._tt is tt:
+        if self._tt == tt:
             self.next()
             return True
         return False
 
-    def nmatch_type(self, tt: TokenType) -> bool:
-        """
-        Increment iterator if 'tt' matches the type of the current token.
-        :param tt: TokenType to match against the current one.
-        :return: False if string matched.
-        """
-        return not self.match_type(tt)
-
-    def match_set(self, s: set) -> bool:
+    def match_set(self, s: frozenset[str]) -> bool:
         """
         If a string is matched the iterator is incremented.
         :param s: Set of strings.
@@ -111,16 +105,7 @@ class Tokens:
             return True
         return False
 
-    def nmatch_set(self, s: set) -> bool:
-        """
-        If a string is matched the iterator is incremented.
-        :param s: Set of strings.
-        :return: True if current token does not match any
-        of the strings in 's'.
-        """
-        return not self.match_set(s)
-
-    def set_t(self, t: str, tt: TokenType):
+    def set_t(self, t: str, tt: int):
         """
         Sets current token to given values.
         :param t: Token text.
@@ -130,75 +115,87 @@ class Tokens:
         self._tt = tt
 
     @property
-    def lookahead(self) -> str:
+    def lookahead(self) -> str | None:
         """Get next token value."""
-        self._tokens, tokens = itertools.tee(self._tokens)
-        t, tt, line = next(tokens)
-        return t
+        return self._next[0]
 
     @property
-    def lookahead_ttt(self) -> Tuple[str, TokenType]:
+    def lookahead_ttt(self) -> tuple[str | None, int | None]:
         """Get next token value and type."""
-        self._tokens, tokens = itertools.tee(self._tokens)
-        t, tt, line = next(tokens)
-        return t, tt
+        return self._next[:2]
 
     @property
-    def get_t(self) -> str:
+    def get_t(self) -> str | None:
         """Get current token string."""
         return self._t
 
     @property
-    def get_tt(self) -> TokenType:
+    def get_tt(self) -> int | None:
         """Get current token's TokenType."""
         return self._tt
 
     @property
-    def empty(self):
+    def empty(self) -> bool:
         """True if all tokens have been processed."""
         return self._t is None
 
     @property
-    def line(self):
+    def line(self) -> int | None:
         """Returns line number of token."""
         return self._line
 
 
+def _error_order(error: tuple[int | None, str]) -> tuple[bool, int]:
+    """
+    Get the key ordering an error by its line number.
+    :param error: Line number of the error, None at the end of the file, and
+    its message.
+    :return: Key placing errors at the end of the file after all others.
+    """
+    line = error[0]
+    if line is None:
+        return True, 0
+    return False, line
+
+
 class ErrorStore:
     """Used for storing all encountered errors."""
+    __slots__ = ('error_count', '_lines', '_messages', 'filename')
 
     def __init__(self, filename):
         """
         :param filename: Name of the file to parse.
         """
-        self._count = 0
-        self._list = []
-        self._filename = filename
+        self.error_count = 0  # Number of errors that have occurred so far.
+        self._lines = []  # Line numbers of the errors.
+        self._messages = []  # Messages of the errors, in the same order.
+        self.filename = filename  # Name of the file being parsed.
 
-    def report(self, line: int, message: str):
+    def report(self, line: int | None, message: str):
         """
         Store an error.
         :param line: The line number of the token creating the error.
         :param message: Message to be displayed to the user.
         """
-        self._count += 1
-        self._list.append((line, message))
-
-    def print_errors(self):
-        """Display all stored errors in order of detection."""
-        print("Errors found")
-        for line, message in self._list:
-            if line is None:
-                print("EOF: " + message)
-            else:
-                print(str(line) + ": " + message)
+        self.error_count += 1
+        self._lines.append(line)
+        self._messages.append(message)
 
-    @property
-    def error_count(self) -> bool:
-        """Get the number of errors that have occured so far."""
-        return self._count
+    def report_many(self, line: int, messages: list[str]):
+        """
+        Store several errors found on the same line.
+        :param line: The line number of the token creating the errors.
+        :param messages: Messages to be displayed to the user, in order.
+        """
+        self.error_count += len(messages)
+        self._lines.extend([line] * len(messages))
+        self._messages.extend(messages)
 
-    @property
-    def filename(self) -> str:
-        """Get the name of the file being parsed."""
-        return self._filename
+    def print_errors(self):
+        """Display all stored errors ordered by line number, with errors at
+        the end of the file last. Errors on the same line are displayed in
+        order of detection."""
+        errors = sorted(zip(self._lines, self._messages), key=_error_order)
+        sys.stdout.write("Errors found\n" + "".join(
+            ("EOF" if line is None else str(line)) + ": " + message + "\n"
+            for line, message in errors))